@@ -12,13 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import functools
 from io import StringIO
 import json
 import os
 import pathlib
-import re
+import pickle
 import sys
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import em
 
@@ -28,34 +31,53 @@ try:
 except ImportError:
     em_has_configuration = False
 
+try:
+    import orjson
+    _json_loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+from rosidl_parser.definition import IdlFile
 from rosidl_parser.definition import IdlLocator
 from rosidl_parser.parser import parse_idl_file
 
 
+@functools.lru_cache(maxsize=8192)
 def convert_camel_case_to_lower_case_underscore(value: str) -> str:
-    # insert an underscore before any upper case letter
-    # which is followed by a lower case letter
-    value = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', value)
-    # insert an underscore before any upper case letter
-    # which is preseded by a lower case letter or number
-    value = re.sub('([a-z0-9])([A-Z])', r'\1_\2', value)
-    return value.lower()
+    chars = []
+    last = len(value) - 1
+    for i, c in enumerate(value):
+        if i and 'A' <= c <= 'Z' and (
+            # insert an underscore before any upper case letter
+            # which is followed by a lower case letter
+            (i < last and 'a' <= value[i + 1] <= 'z' and value[i - 1] != '\n') or
+            # insert an underscore before any upper case letter
+            # which is preseded by a lower case letter or number
+            'a' <= value[i - 1] <= 'z' or '0' <= value[i - 1] <= '9'
+        ):
+            chars.append('_')
+        chars.append(c)
+    return ''.join(chars).lower()
 
 
 def read_generator_arguments(input_file: str) -> Any:
-    with open(input_file, mode='r', encoding='utf-8') as h:
-        return json.load(h)
+    return _read_json(input_file)
+
+
+def _read_json(input_file: str) -> Any:
+    with open(input_file, 'rb') as h:
+        return _json_loads(h.read())
 
 
 def get_newest_modification_time(
     target_dependencies: List[str]
 ) -> Optional[float]:
-    newest_timestamp = None
-    for dep in target_dependencies:
-        ts = os.path.getmtime(dep)
-        if newest_timestamp is None or ts > newest_timestamp:
-            newest_timestamp = ts
-    return newest_timestamp
+    return max(
+        (os.stat(dep).st_mtime for dep in target_dependencies), default=None)
+
+
+# templates which have already been checked to exist
+_template_exists_cache: Set[Tuple[str, str]] = set()
 
 
 def generate_files(
@@ -67,8 +89,11 @@ def generate_files(
 
     template_basepath = pathlib.Path(args['template_dir'])
     for template_filename in mapping.keys():
-        assert (template_basepath / template_filename).exists(), \
-            'Could not find template: ' + template_filename
+        key = (args['template_dir'], template_filename)
+        if key not in _template_exists_cache:
+            assert (template_basepath / template_filename).exists(), \
+                'Could not find template: ' + template_filename
+            _template_exists_cache.add(key)
 
     latest_target_timestamp = get_newest_modification_time(args['target_dependencies'])
     generated_files: List[str] = []
@@ -82,71 +107,272 @@ def generate_files(
     for ros_interface_file in args.get('ros_interface_files',  []):
         p = pathlib.Path(ros_interface_file)
         # e.g. ('msg', 'Empty')
-        key = (p.suffix[1:], p.stem)
+        key = (sys.intern(p.suffix[1:]), sys.intern(p.stem))
         ros_interface_files[key] = p
 
-    for idl_tuple in args.get('idl_tuples', []):
-        idl_parts = idl_tuple.rsplit(':', 1)
-        assert len(idl_parts) == 2
-        locator = IdlLocator(*idl_parts)
-        idl_rel_path = pathlib.Path(idl_parts[1])
-
-        type_description_info = None
-        if type_description_files:
-            type_hash_file = type_description_files[idl_parts[1]]
-            with open(type_hash_file, 'r') as f:
-                type_description_info = json.load(f)
-
-        idl_stem = idl_rel_path.stem
-        type_source_key = (idl_rel_path.parts[-2], idl_stem)
-        type_source_file = ros_interface_files.get(type_source_key, locator.get_absolute_path())
-        if not keep_case:
-            idl_stem = convert_camel_case_to_lower_case_underscore(idl_stem)
-        try:
-            idl_file = parse_idl_file(locator)
-            for template_file, generated_filename in mapping.items():
-                generated_file = os.path.join(
-                    args['output_dir'], str(idl_rel_path.parent),
-                    generated_filename % idl_stem)
-                generated_files.append(generated_file)
-                data = {
-                    'package_name': args['package_name'],
-                    'interface_path': idl_rel_path,
-                    'content': idl_file.content,
-                    'type_description_info': type_description_info,
-                    'type_source_file': type_source_file,
-                }
-                if additional_context is not None:
-                    data.update(additional_context)
-                expand_template(
-                    os.path.basename(template_file), data,
-                    generated_file, minimum_timestamp=latest_target_timestamp,
-                    template_basepath=template_basepath,
-                    post_process_callback=post_process_callback)
-        except Exception as e:
-            print(
-                'Error processing idl file: ' +
-                str(locator.get_absolute_path()), file=sys.stderr)
-            raise e
+    generate_idl_files_kwargs = {
+        'package_name': args['package_name'],
+        'output_dir': args['output_dir'],
+        'template_basepath': template_basepath,
+        'templates': [
+            (os.path.basename(template_file), generated_filename)
+            for template_file, generated_filename in mapping.items()],
+        'type_description_files': type_description_files,
+        'ros_interface_files': ros_interface_files,
+        'additional_context': additional_context or {},
+        'keep_case': keep_case,
+        'post_process_callback': post_process_callback,
+        'minimum_timestamp': latest_target_timestamp,
+    }
+
+    # the interface files are independent of each other,
+    # process them in parallel if requested
+    idl_tuples = args.get('idl_tuples', [])
+    max_workers = min(len(idl_tuples) - 1, _get_max_workers())
+    # the arguments are passed to each worker process once, they need to be
+    # picklable though (e.g. the callback or the additional context might not be)
+    if max_workers > 1 and _is_picklable(generate_idl_files_kwargs):
+        # the first interface is processed in the current process,
+        # forked worker processes reuse the parser built for it
+        generated_files += _generate_idl_files(idl_tuples[0], **generate_idl_files_kwargs)
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker,
+            initargs=(generate_idl_files_kwargs,)
+        ) as executor:
+            for idl_generated_files in executor.map(
+                _generate_idl_files_in_worker, idl_tuples[1:]
+            ):
+                generated_files += idl_generated_files
+    else:
+        for idl_tuple in idl_tuples:
+            generated_files += _generate_idl_files(idl_tuple, **generate_idl_files_kwargs)
+
+    return generated_files
+
+
+def _get_max_workers() -> int:
+    # the generators are commonly invoked in parallel already (e.g. by make -j
+    # or colcon), so worker processes are only used when requested explicitly
+    value = os.environ.get('ROSIDL_PYCOMMON_MAX_WORKERS')
+    if not value:
+        return 1
+    try:
+        max_workers = int(value)
+    except ValueError:
+        max_workers = 0
+    if max_workers < 1:
+        print(
+            f"Ignoring invalid value '{value}' of ROSIDL_PYCOMMON_MAX_WORKERS, "
+            'expected a positive integer', file=sys.stderr)
+        return 1
+    return min(max_workers, os.cpu_count() or 1)
+
+
+def _is_picklable(obj: Any) -> bool:
+    try:
+        pickle.loads(pickle.dumps(obj))
+    except Exception:
+        return False
+    return True
+
+
+# the arguments of _generate_idl_files shared by all interfaces in a worker process
+_worker_kwargs: Dict[str, Any] = {}
+
+
+def _init_worker(generate_idl_files_kwargs: Dict[str, Any]) -> None:
+    global _worker_kwargs
+    _worker_kwargs = generate_idl_files_kwargs
 
+
+def _generate_idl_files_in_worker(idl_tuple: str) -> List[str]:
+    return _generate_idl_files(idl_tuple, **_worker_kwargs)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_idl_file(basepath: str, relative_path: str, mtime: float) -> IdlFile:
+    # interface files are parsed again once their modification time changes,
+    # the parsed content is shared and must not be modified by the templates
+    return parse_idl_file(IdlLocator(basepath, relative_path))
+
+
+def _load_idl_file(
+    locator: IdlLocator, type_description_file: Optional[str]
+) -> Tuple[IdlFile, Any]:
+    idl_file = _parse_idl_file(
+        str(locator.basepath), str(locator.relative_path),
+        os.path.getmtime(locator.get_absolute_path()))
+    type_description_info = None
+    if type_description_file is not None:
+        type_description_info = _read_json(type_description_file)
+    return idl_file, type_description_info
+
+
+def _generate_idl_files(
+    idl_tuple: str, *, package_name: str, output_dir: str,
+    template_basepath: pathlib.Path, templates: List[Tuple[str, str]],
+    type_description_files: Dict[str, str],
+    ros_interface_files: Dict[Tuple[str, str], pathlib.Path],
+    additional_context: Dict[str, bool], keep_case: bool,
+    post_process_callback: Optional[Callable[[str], str]],
+    minimum_timestamp: Optional[float]
+) -> List[str]:
+    idl_parts = idl_tuple.rsplit(':', 1)
+    assert len(idl_parts) == 2
+    locator = IdlLocator(*idl_parts)
+    # the templates expect a path object, use plain strings otherwise
+    idl_rel_path = pathlib.Path(idl_parts[1])
+    idl_parent, idl_basename = os.path.split(idl_parts[1])
+    idl_stem = os.path.splitext(idl_basename)[0]
+
+    type_hash_file = None
+    if type_description_files:
+        type_hash_file = type_description_files[idl_parts[1]]
+
+    type_source_file = None
+    if ros_interface_files:
+        type_source_key = (os.path.basename(idl_parent), idl_stem)
+        type_source_file = ros_interface_files.get(type_source_key)
+    if type_source_file is None:
+        type_source_file = locator.get_absolute_path()
+    if not keep_case:
+        idl_stem = convert_camel_case_to_lower_case_underscore(idl_stem)
+
+    generated_files: List[str] = []
+    try:
+        idl_file, type_description_info = _load_idl_file(locator, type_hash_file)
+        # the same data is used for all templates since expand_template copies it
+        data = {
+            'package_name': package_name,
+            'interface_path': idl_rel_path,
+            'content': idl_file.content,
+            'type_description_info': type_description_info,
+            'type_source_file': type_source_file,
+            **additional_context,
+        }
+        for template_file, generated_filename in templates:
+            generated_file = os.path.join(
+                output_dir, idl_parent, generated_filename % idl_stem)
+            generated_files.append(generated_file)
+            expand_template(
+                template_file, data,
+                generated_file, minimum_timestamp=minimum_timestamp,
+                template_basepath=template_basepath,
+                post_process_callback=post_process_callback)
+    except Exception as e:
+        print(
+            'Error processing idl file: ' +
+            str(locator.get_absolute_path()), file=sys.stderr)
+        # exceptions are passed back from the worker processes by pickling them
+        # which fails for some of the exceptions raised by the parser, raise the
+        # same exception independent of the worker processes being used
+        if not _is_picklable(e):
+            raise RuntimeError(f'{e.__class__.__name__}: {e}') from e
+        raise e
     return generated_files
 
 
 template_prefix_path: List[pathlib.Path] = []
 
+# resolved template paths keyed by the prefix path and the template name
+_template_path_cache: Dict[Tuple[Tuple[pathlib.Path, ...], str], pathlib.Path] = {}
+
 
 def get_template_path(template_name: str) -> pathlib.Path:
     global template_prefix_path
-    for basepath in template_prefix_path:
-        template_path = basepath / template_name
-        if template_path.exists():
-            return template_path
-    raise RuntimeError(f"Failed to find template '{template_name}'")
+    key = (tuple(template_prefix_path), template_name)
+    template_path = _template_path_cache.get(key)
+    if template_path is None:
+        # missing templates are looked up again since they might be created later
+        for basepath in template_prefix_path:
+            candidate = basepath / template_name
+            if candidate.exists():
+                template_path = _template_path_cache[key] = candidate
+                break
+        else:
+            raise RuntimeError(f"Failed to find template '{template_name}'")
+    return template_path
+
+
+@functools.lru_cache(maxsize=256)
+def _load_template(template_path: str, mtime: float) -> str:
+    # the modification time is part of the cache key
+    # so that changes to a template are picked up
+    with open(template_path, 'r') as h:
+        return h.read()
+
+
+def _read_template(template_path: pathlib.Path) -> str:
+    return _load_template(str(template_path), os.path.getmtime(template_path))
 
 
 interpreter = None
 
 
+def _prepare_interpreter(template_path: pathlib.Path, output: StringIO) -> None:
+    # the interpreter is created once and reused for all expansions,
+    # only its output stream, stacks and globals are reset between them
+    global interpreter
+    if interpreter is None:
+        if em_has_configuration:
+            config = Configuration(
+                deleteOnError=True,
+                rawErrors=True,
+                useProxy=True)
+            interpreter = em.Interpreter(
+                config=config,
+                dispatcher=False)
+        else:
+            interpreter = em.Interpreter(
+                options={
+                    em.BUFFERED_OPT: True,
+                    em.RAW_OPT: True,
+                },
+            )
+        atexit.register(_shutdown_interpreter)
+        # the stdout proxy is only installed while expanding a template
+        _uninstall_stdout_proxy()
+
+    _install_stdout_proxy()
+    interpreter.output = output
+    if em_has_configuration:
+        interpreter.root = template_path
+        interpreter.reset(True)
+        interpreter.clearGlobals()
+    else:
+        interpreter.clear()
+        interpreter.reset()
+
+
+def _install_stdout_proxy() -> None:
+    # the proxy redirects print() calls in templates to the expanded output,
+    # it has to wrap the current stdout which might have been replaced since
+    # the last expansion
+    assert interpreter is not None
+    if em_has_configuration:
+        interpreter.installProxy(sys.stdout)
+    else:
+        # EmPy 3 keeps its proxy installed for the lifetime of the process
+        try:
+            getattr(sys.stdout, '_testProxy')()
+        except AttributeError:
+            sys.stdout = em.ProxyFile(sys.stdout)
+
+
+def _uninstall_stdout_proxy() -> None:
+    assert interpreter is not None
+    if em_has_configuration:
+        # restores the stdout which was replaced by the proxy
+        interpreter.uninstallProxy()
+
+
+def _shutdown_interpreter() -> None:
+    assert interpreter is not None
+    # shutting down pushes the interpreter onto the stdout proxy
+    _install_stdout_proxy()
+    interpreter.shutdown()
+
+
 def expand_template(
     template_name: str, data: Dict[str, Any], output_file: str,
     minimum_timestamp: Optional[float] = None,
@@ -161,38 +387,26 @@ def expand_template(
 
     global template_prefix_path
     template_prefix_path.append(template_basepath)
-    template_path = get_template_path(template_name)
+    try:
+        template_path = get_template_path(template_name)
+    except RuntimeError:
+        # do not leave the prefix path behind, it is part of the cache key too
+        template_prefix_path.pop()
+        raise
 
-    global interpreter
     output = StringIO()
-    if em_has_configuration:
-        config = Configuration(
-            defaultRoot=template_path,
-            defaultStdout=output,
-            deleteOnError=True,
-            rawErrors=True,
-            useProxy=True)
-        interpreter = em.Interpreter(
-            config=config,
-            dispatcher=False)
-    else:
-        interpreter = em.Interpreter(
-            output=output,
-            options={
-                em.BUFFERED_OPT: True,
-                em.RAW_OPT: True,
-            },
-        )
-
-    # create copy before manipulating
+    _prepare_interpreter(template_path, output)
+    assert interpreter is not None
+
+    # create copy before manipulating,
+    # the template code also stores its own variables in the passed locals
     data = dict(data)
     _add_helper_functions(data)
 
     try:
-        with template_path.open('r') as h:
-            template_content = h.read()
-            interpreter.invoke(
-                'beforeFile', name=template_name, file=h, locals=data)
+        template_content = _read_template(template_path)
+        interpreter.invoke(
+            'beforeFile', name=template_name, file=StringIO(template_content), locals=data)
         if em_has_configuration:
             interpreter.string(template_content, locals=data)
         else:
@@ -205,31 +419,42 @@ def expand_template(
               f"'{output_file}': {e}", file=sys.stderr)
         raise
     finally:
+        _uninstall_stdout_proxy()
         template_prefix_path.pop()
 
     content = output.getvalue()
-    interpreter.shutdown()
 
     if post_process_callback:
         content = post_process_callback(content)
 
+    encoded_content = _encode_content(content)
+
     # only overwrite file if necessary
     # which is either when the timestamp is too old or when the content is different
-    if os.path.exists(output_file):
-        timestamp = os.path.getmtime(output_file)
-        if minimum_timestamp is None or timestamp > minimum_timestamp:
-            with open(output_file, 'r', encoding='utf-8') as h:
-                if h.read() == content:
-                    return
-    else:
+    try:
+        output_stat = os.stat(output_file)
+    except FileNotFoundError:
         # create folder if necessary
-        try:
-            os.makedirs(os.path.dirname(output_file))
-        except FileExistsError:
-            pass
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    else:
+        # skip reading the file if the size already differs
+        if (
+            (minimum_timestamp is None or output_stat.st_mtime > minimum_timestamp) and
+            output_stat.st_size == len(encoded_content)
+        ):
+            with open(output_file, 'rb') as h:
+                if h.read() == encoded_content:
+                    return
+
+    with open(output_file, 'wb') as h:
+        h.write(encoded_content)
 
-    with open(output_file, 'w', encoding='utf-8') as h:
-        h.write(content)
+
+def _encode_content(content: str) -> bytes:
+    # same line endings as a file written in text mode
+    if os.linesep != '\n':
+        content = content.replace('\n', os.linesep)
+    return content.encode('utf-8')
 
 
 def _add_helper_functions(data: Dict[str, Any]) -> None:
@@ -243,10 +468,9 @@ def _expand_template(template_name: str, **kwargs: Any) -> None:
     if interpreter is None:
         raise RuntimeError('_expand_template called before expand_template')
 
-    with template_path.open('r') as h:
-        interpreter.invoke(
-            'beforeInclude', name=str(template_path), file=h, locals=kwargs)
-        content = h.read()
+    content = _read_template(template_path)
+    interpreter.invoke(
+        'beforeInclude', name=str(template_path), file=StringIO(content), locals=kwargs)
     try:
         if em_has_configuration:
             interpreter.string(content, locals=kwargs)
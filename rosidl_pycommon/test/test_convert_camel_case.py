@@ -0,0 +1,34 @@
+# Copyright 2026 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from rosidl_pycommon import convert_camel_case_to_lower_case_underscore
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('', ''),
+    ('Empty', 'empty'),
+    ('already_lower', 'already_lower'),
+    ('MyMessage', 'my_message'),
+    ('HTTPServer', 'http_server'),
+    ('Vector3D', 'vector3_d'),
+    ('Int32MultiArray', 'int32_multi_array'),
+    ('FooBarABC', 'foo_bar_abc'),
+    ('ABcDEf', 'a_bc_d_ef'),
+    ('WStrings', 'w_strings'),
+    ('Foo_Bar', 'foo__bar'),
+    ('MyService_Request', 'my_service__request'),
+])
+def test_convert_camel_case_to_lower_case_underscore(value, expected):
+    assert convert_camel_case_to_lower_case_underscore(value) == expected
@@ -0,0 +1,155 @@
+# Copyright 2026 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+import rosidl_pycommon
+from rosidl_pycommon import expand_template
+
+TEMPLATES = {
+    'define.txt.em': (
+        'define @(value)\n'
+        '@{\n'
+        'global leaked_global\n'
+        'leaked_global = value\n'
+        'leaked_local = value\n'
+        '}'
+    ),
+    'check.txt.em': (
+        'check @(value)\n'
+        '@{\n'
+        'found = []\n'
+        "for name in ('leaked_global', 'leaked_local'):\n"
+        '    try:\n'
+        '        eval(name)\n'
+        '        found.append(name)\n'
+        '    except NameError:\n'
+        '        pass\n'
+        '}'
+        'leaked @(found)\n'
+    ),
+    'nested.txt.em': (
+        'outer @(value)\n'
+        "@{TEMPLATE('inner.txt.em', value=value + 1)}"
+        'outer end\n'
+    ),
+    'inner.txt.em': 'inner @(value)\n',
+    'print.txt.em': "@{print('printed', value)}",
+    'fail.txt.em': 'partial output\n@(undefined_name)\n',
+}
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    for name, content in TEMPLATES.items():
+        (template_dir / name).write_text(content)
+    return template_dir
+
+
+def expand(template_dir, template_name, output_file, **data):
+    expand_template(
+        template_name, data, str(output_file), template_basepath=template_dir)
+    return output_file.read_text()
+
+
+def test_sequential_expansions_are_isolated(template_dir, tmp_path):
+    assert expand(template_dir, 'define.txt.em', tmp_path / 'a.txt', value=1) == \
+        'define 1\n'
+    assert expand(template_dir, 'check.txt.em', tmp_path / 'b.txt', value=2) == \
+        'check 2\nleaked []\n'
+
+
+def test_data_is_not_modified(template_dir, tmp_path):
+    data = {'value': 1}
+    expand_template(
+        'define.txt.em', data, str(tmp_path / 'a.txt'), template_basepath=template_dir)
+    assert data == {'value': 1}
+
+
+def test_nested_template(template_dir, tmp_path):
+    assert expand(template_dir, 'nested.txt.em', tmp_path / 'a.txt', value=1) == \
+        'outer 1\ninner 2\nouter end\n'
+    assert expand(template_dir, 'inner.txt.em', tmp_path / 'b.txt', value=5) == \
+        'inner 5\n'
+
+
+def test_print_output(template_dir, tmp_path, capsys):
+    assert expand(template_dir, 'print.txt.em', tmp_path / 'a.txt', value=1) == \
+        'printed 1\n'
+    print('after expansion')
+    assert 'after expansion' in capsys.readouterr().out
+    assert expand(template_dir, 'print.txt.em', tmp_path / 'b.txt', value=2) == \
+        'printed 2\n'
+
+
+def test_expansion_after_failure(template_dir, tmp_path):
+    failed_file = tmp_path / 'failed.txt'
+    with pytest.raises(NameError):
+        expand(template_dir, 'fail.txt.em', failed_file)
+    assert not failed_file.exists()
+    assert expand(template_dir, 'nested.txt.em', tmp_path / 'a.txt', value=1) == \
+        'outer 1\ninner 2\nouter end\n'
+
+
+@pytest.mark.parametrize('content,minimum_timestamp,rewritten', [
+    # identical content newer than the dependencies
+    ('inner 5\n', None, False),
+    ('inner 5\n', 500, False),
+    # identical content older than the dependencies
+    ('inner 5\n', 2000, True),
+    # same size but different content
+    ('inner 6\n', None, True),
+    ('inner 6\n', 500, True),
+    # different size
+    ('inner 55\n', 500, True),
+])
+def test_existing_output(template_dir, tmp_path, content, minimum_timestamp, rewritten):
+    output_file = tmp_path / 'a.txt'
+    output_file.write_text(content)
+    os.utime(output_file, (1000, 1000))
+    expand_template(
+        'inner.txt.em', {'value': 5}, str(output_file),
+        minimum_timestamp=minimum_timestamp, template_basepath=template_dir)
+    assert output_file.read_text() == 'inner 5\n'
+    assert (output_file.stat().st_mtime != 1000) == rewritten
+
+
+def test_modified_template(template_dir, tmp_path):
+    assert expand(template_dir, 'inner.txt.em', tmp_path / 'a.txt', value=1) == \
+        'inner 1\n'
+    template_file = template_dir / 'inner.txt.em'
+    template_file.write_text('modified @(value)\n')
+    mtime = template_file.stat().st_mtime + 10
+    os.utime(template_file, (mtime, mtime))
+    assert expand(template_dir, 'inner.txt.em', tmp_path / 'b.txt', value=1) == \
+        'modified 1\n'
+
+
+def test_missing_template(template_dir, tmp_path):
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="Failed to find template 'missing.txt.em'"):
+            expand(template_dir, 'missing.txt.em', tmp_path / 'a.txt')
+    assert not (tmp_path / 'a.txt').exists()
+    # a template created after a failed lookup is found
+    (template_dir / 'missing.txt.em').write_text('found @(value)\n')
+    assert expand(template_dir, 'missing.txt.em', tmp_path / 'a.txt', value=1) == \
+        'found 1\n'
+    # a missing nested template fails the expansion of the outer template
+    (template_dir / 'inner.txt.em').unlink()
+    with pytest.raises(RuntimeError, match="Failed to find template 'inner.txt.em'"):
+        expand(template_dir, 'nested.txt.em', tmp_path / 'b.txt', value=1)
+    assert rosidl_pycommon.template_prefix_path == []
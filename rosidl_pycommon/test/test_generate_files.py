@@ -0,0 +1,184 @@
+# Copyright 2026 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+import traceback
+
+import pytest
+from rosidl_parser.parser import parse_idl_file
+import rosidl_pycommon
+from rosidl_pycommon import generate_files
+
+MESSAGE_NAMES = ['FirstMessage', 'Second', 'ThirdMessage', 'Fourth']
+
+IDL_TEMPLATE = """\
+module test_pkg {
+  module msg {
+    struct %s {
+      int32 value;
+    };
+  };
+};
+"""
+
+TEMPLATE = """\
+@{
+import os
+import threading
+import traceback
+from rosidl_parser.definition import Message
+message = content.get_elements_of_type(Message)[0]
+}@
+@(message.structure.namespaced_type.name) @(os.getpid())
+"""
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    monkeypatch.delenv('ROSIDL_PYCOMMON_MAX_WORKERS', raising=False)
+    (tmp_path / 'msg').mkdir()
+    for name in MESSAGE_NAMES:
+        (tmp_path / 'msg' / f'{name}.idl').write_text(IDL_TEMPLATE % name)
+    (tmp_path / 'msg' / 'Broken.idl').write_text('module test_pkg { struct ; };\n')
+    (tmp_path / 'templates').mkdir()
+    (tmp_path / 'templates' / 'test.txt.em').write_text(TEMPLATE)
+    return tmp_path
+
+
+def write_arguments(package, names):
+    arguments_file = package / 'arguments.json'
+    arguments_file.write_text(json.dumps({
+        'package_name': 'test_pkg',
+        'output_dir': str(package / 'output'),
+        'template_dir': str(package / 'templates'),
+        'idl_tuples': [f'{package}:msg/{name}.idl' for name in names],
+        'target_dependencies': [],
+    }))
+    return str(arguments_file)
+
+
+def generate(package, names=MESSAGE_NAMES, **kwargs):
+    generated_files = generate_files(
+        write_arguments(package, names), {'test.txt.em': '%s.txt'}, **kwargs)
+    expected_files = [
+        os.path.join(package / 'output', 'msg', file_name)
+        for file_name in (
+            'first_message.txt', 'second.txt', 'third_message.txt', 'fourth.txt')]
+    assert generated_files == expected_files
+    contents = []
+    pids = []
+    for generated_file in generated_files:
+        with open(generated_file, 'r') as h:
+            name, pid = h.read().split()
+        contents.append(name)
+        pids.append(int(pid))
+    return contents, pids
+
+
+def assert_serial(pids):
+    assert pids == [os.getpid()] * len(pids)
+
+
+def assert_parallel(pids):
+    # the first interface is always processed in the current process
+    assert pids[0] == os.getpid()
+    assert os.getpid() not in pids[1:]
+
+
+@pytest.mark.parametrize('cpu_count,max_workers', [
+    (1, None),
+    (4, None),
+    (4, '1'),
+    (1, '64'),
+])
+def test_generate_files_serial(package, monkeypatch, cpu_count, max_workers):
+    monkeypatch.setattr(os, 'cpu_count', lambda: cpu_count)
+    if max_workers is not None:
+        monkeypatch.setenv('ROSIDL_PYCOMMON_MAX_WORKERS', max_workers)
+    contents, pids = generate(package)
+    assert contents == MESSAGE_NAMES
+    assert_serial(pids)
+
+
+def test_generate_files_parallel(package, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    monkeypatch.setenv('ROSIDL_PYCOMMON_MAX_WORKERS', '64')
+    contents, pids = generate(package, post_process_callback=str.upper)
+    assert contents == [name.upper() for name in MESSAGE_NAMES]
+    assert_parallel(pids)
+
+
+def test_generate_files_parse_cache(package, monkeypatch):
+    parsed = []
+
+    def parse(locator):
+        parsed.append(locator.relative_path.name)
+        return parse_idl_file(locator)
+    monkeypatch.setattr(rosidl_pycommon, 'parse_idl_file', parse)
+
+    assert generate(package)[0] == MESSAGE_NAMES
+    assert generate(package)[0] == MESSAGE_NAMES
+    assert len(parsed) == len(MESSAGE_NAMES)
+
+    # a modified interface file is parsed again
+    idl_file = package / 'msg' / 'Second.idl'
+    idl_file.write_text(IDL_TEMPLATE % 'Changed')
+    mtime = idl_file.stat().st_mtime + 10
+    os.utime(idl_file, (mtime, mtime))
+    assert generate(package)[0] == ['FirstMessage', 'Changed', 'ThirdMessage', 'Fourth']
+    assert parsed[len(MESSAGE_NAMES):] == ['Second.idl']
+
+
+@pytest.mark.parametrize('max_workers', ['auto', '0', '-2'])
+def test_generate_files_invalid_max_workers(package, monkeypatch, capsys, max_workers):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    monkeypatch.setenv('ROSIDL_PYCOMMON_MAX_WORKERS', max_workers)
+    contents, pids = generate(package)
+    assert contents == MESSAGE_NAMES
+    assert_serial(pids)
+    assert f"invalid value '{max_workers}' of ROSIDL_PYCOMMON_MAX_WORKERS" in \
+        capsys.readouterr().err
+
+
+def test_generate_files_unpicklable_callback(package, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    monkeypatch.setenv('ROSIDL_PYCOMMON_MAX_WORKERS', '4')
+    contents, pids = generate(
+        package, post_process_callback=lambda content: content.lower())
+    assert contents == [name.lower() for name in MESSAGE_NAMES]
+    assert_serial(pids)
+
+
+def test_generate_files_unpicklable_context(package, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    monkeypatch.setenv('ROSIDL_PYCOMMON_MAX_WORKERS', '4')
+    contents, pids = generate(
+        package, additional_context={'lock': threading.Lock()})
+    assert contents == MESSAGE_NAMES
+    assert_serial(pids)
+
+
+@pytest.mark.parametrize('max_workers', ['1', '4'])
+def test_generate_files_error(package, monkeypatch, max_workers):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    monkeypatch.setenv('ROSIDL_PYCOMMON_MAX_WORKERS', max_workers)
+    with pytest.raises(RuntimeError, match='UnexpectedCharacters') as e:
+        generate_files(
+            write_arguments(package, ['FirstMessage', 'Second', 'Broken']),
+            {'test.txt.em': '%s.txt'})
+    # the original exception is chained, from a worker process as its traceback
+    formatted = traceback.format_exception(type(e.value), e.value, e.value.__traceback__)
+    assert 'lark.exceptions.UnexpectedCharacters' in ''.join(formatted)